@@ -1,67 +1,90 @@
-import csv
 import time
+import orjson
 import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from bluebikes.tsp.helpers import load_stations
 
 # Settings
-OSRM_URL = "http://localhost:5000/route/v1/bicycle"
+OSRM_URL = "http://localhost:5000/table/v1/bicycle"
 INPUT_FILE = "stations.csv"       # CSV with columns: id, station_name, lat, lng
 METRIC = "distance"
 OUTPUT_FILE = f"{METRIC}_matrix.csv"
-REQUEST_DELAY = 0.001               # Delay between requests (5ms)
+MAX_WORKERS = 32                    # Concurrent requests against the local OSRM server
+TILE_SIZE = 100                     # OSRM's default --max-table-size
 
-def load_stations(file_path):
-    stations = []
-    with open(file_path, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            stations.append({
-                "id": row["id"],
-                "name": row["station_name"],
-                "lat": float(row["lat"]),
-                "lng": float(row["lng"])
-            })
-    return stations
+# Module-level session so tile requests reuse keep-alive connections instead of reconnecting
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=0))
 
-
-def query_route(o_lng, o_lat, d_lng, d_lat, retries=3):
-    url = f"{OSRM_URL}/{o_lng},{o_lat};{d_lng},{d_lat}?overview=false"
+def query_table_tile(stations, sources, destinations, retries=3):
+    """
+    Query the OSRM table for the METRIC from every station in `sources` to every
+    station in `destinations`. Only the coordinates of the two blocks go in the URL.
+    """
+    tile = np.concatenate((sources, destinations))
+    coords = ";".join(f"{lng},{lat}" for lng, lat in zip(stations.lng[tile].tolist(), stations.lat[tile].tolist()))
+    url = f"{OSRM_URL}/{coords}"
+    params = {
+        "sources": ";".join(str(k) for k in range(len(sources))),
+        "destinations": ";".join(str(len(sources) + k) for k in range(len(destinations))),
+        "annotations": METRIC
+    }
     for attempt in range(retries):
         try:
-            r = requests.get(url, timeout=5)
+            r = SESSION.get(url, params=params, timeout=30)
             r.raise_for_status()
-            data = r.json()
-            if "routes" in data and data["routes"]:
-                route = data["routes"][0]
-                return route[METRIC]
-        except Exception as e:
-            print(f"Error on attempt {attempt+1} for {url}: {e}")
+            data = orjson.loads(r.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            print(f"Error on attempt {attempt+1} for sources {sources}, destinations {destinations}: {e}")
             time.sleep(1)
+            continue
+
+        if data.get("code") == "Ok":
+            # Unreachable pairs come back as null and become NaN
+            return np.array(data[f"{METRIC}s"], dtype=np.float64)
+        print(f"OSRM error for sources {sources}, destinations {destinations}: {data.get('message', 'Unknown error')}")
+        return None
     return None
 
 
-def build_and_write_matrix(file_path, stations):
+def build_matrix(stations):
+    """
+    Assemble the full matrix from TILE_SIZE x TILE_SIZE /table requests issued concurrently.
+    """
     n = len(stations)
-    with open(file_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        header = ["id"] + [s["id"] for s in stations]
-        writer.writerow(header)
+    matrix = np.full((n, n), np.nan)
+    blocks = [range(k, min(k + TILE_SIZE, n)) for k in range(0, n, TILE_SIZE)]
+    tiles = [(sources, destinations) for sources in blocks for destinations in blocks]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = executor.map(lambda tile: query_table_tile(stations, *tile), tiles)
+        # tqdm counts a tile only when the next one is requested, so it goes first in zip to see the end of the results
+        for result, (sources, destinations) in zip(tqdm(results, total=len(tiles), desc="Building matrix", unit="tile"), tiles):
+            if result is None:
+                raise RuntimeError(f"Could not get the {METRIC} tile for sources {sources}, destinations {destinations}")
+            matrix[sources.start:sources.stop, destinations.start:destinations.stop] = result
+
+    # A NaN would reach the solvers as a nonsense edge cost, so unreachable pairs stop the build
+    unreachable = np.argwhere(np.isnan(matrix))
+    if len(unreachable):
+        i, j = unreachable[0]
+        raise RuntimeError(f"OSRM has no {METRIC} for {len(unreachable)} station pairs, e.g. from station {stations.ids[i]} to station {stations.ids[j]}")
+    return matrix
+
 
-        for i in tqdm(range(n), desc="Building matrix", unit="row"):
-            row = [0.0] * n
-            for j in range(n):
-                if i == j:
-                    continue
-                dist = query_route(stations[i]["lng"], stations[i]["lat"], stations[j]["lng"], stations[j]["lat"])
-                row[j] = dist
-                time.sleep(REQUEST_DELAY)
-            writer.writerow([stations[i]["id"]] + row)
-            f.flush()  # Ensure it's written to disk immediately to free memory
+def write_matrix(file_path, stations, matrix):
+    # OSRM reports distances and durations to a tenth of a meter/second
+    header = ",".join(["id"] + [str(station_id) for station_id in stations.ids.tolist()])
+    np.savetxt(file_path, np.column_stack((stations.ids, matrix)), delimiter=",", fmt=["%d"] + ["%.1f"] * len(stations), header=header, comments="")
 
 
 def main():
     stations = load_stations(INPUT_FILE)
-    build_and_write_matrix(OUTPUT_FILE, stations)
+    matrix = build_matrix(stations)
+    write_matrix(OUTPUT_FILE, stations, matrix)
     print(f"{METRIC} matrix saved to {OUTPUT_FILE}")
 
 
@@ -1,54 +1,94 @@
-import json
+import os
+import time
+import orjson
 import requests
-import folium
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Tuple
 from bluebikes.tsp.helpers import load_route
+from bluebikes.tsp.helpers_numba import decode_polyline
 
 # OSRM settings
 OSRM_URL = "http://localhost:5000/route/v1/bicycle"
 ROUTE_FILE = 'outputs/routes/osrm_route.csv'
-REQUEST_DELAY = 0.01  # Small delay between requests to avoid overwhelming the server
+MAP_TEMPLATE = os.path.join(os.path.dirname(__file__), 'map_template.html')
+MAX_WORKERS = 32  # Concurrent route requests; OSRM on localhost handles these in parallel
+MAX_WAYPOINTS = 100  # Stops per /route request, well under OSRM's default max-viaroute-size of 500
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY  # Geometry coordinates are numpy arrays
 
-def get_route_geometry(start_coords: Tuple[float, float], end_coords: Tuple[float, float], retries: int = 3) -> Dict:
+# Keep-alive connections to OSRM, pooled with one slot per worker thread
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=0))
+
+def get_leg_geometry(leg: Dict) -> Dict:
     """
-    Get detailed route geometry from OSRM for a segment.
+    Build a GeoJSON LineString for one leg by joining the geometries of its steps.
     
     Args:
-        start_coords: (lng, lat) tuple for start point
-        end_coords: (lng, lat) tuple for end point
-        retries: Number of retry attempts
+        leg: Route leg from OSRM, requested with steps and polyline6 geometries
         
     Returns:
-        Dictionary containing route information including geometry
+        GeoJSON LineString geometry
+    """
+    coords = np.concatenate([decode_polyline(step['geometry'], precision=6) for step in leg['steps']])
+    
+    # Consecutive steps share their boundary point, so drop the repeats
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    
+    return {
+        'type': 'LineString',
+        # GeoJSON order is [lng, lat]; kept as an array and serialized natively by orjson
+        'coordinates': np.ascontiguousarray(coords[keep][:, ::-1])
+    }
+
+def get_route_legs(coords: List[Tuple[float, float]], retries: int = 3) -> List[Dict]:
     """
-    start_lng, start_lat = start_coords
-    end_lng, end_lat = end_coords
+    Get detailed route geometry from OSRM for a chain of stops in a single request.
     
+    Args:
+        coords: (lng, lat) tuples for the stops, in visiting order
+        retries: Number of retry attempts
+        
+    Returns:
+        List with the route information of each leg between consecutive stops, including geometry
+    """
     # OSRM expects coordinates in lng,lat format
-    url = f"{OSRM_URL}/{start_lng},{start_lat};{end_lng},{end_lat}"
+    url = f"{OSRM_URL}/{';'.join(f'{lng},{lat}' for lng, lat in coords)}"
     params = {
-        'overview': 'full',  # Get full geometry
-        'geometries': 'geojson',  # Return as GeoJSON
+        'overview': 'false',  # Leg geometries are rebuilt from the steps instead
+        'geometries': 'polyline6',  # Compact encoded string, decoded locally
         'steps': 'true',  # Include turn-by-turn directions
         'annotations': 'true'  # Include additional route annotations
     }
     
-    res = requests.get(url, params=params)
-    res.raise_for_status()
-    data = res.json()
-    
-    if data.get('code') == 'Ok' and data.get('routes'):
-        route = data['routes'][0]
-        return {
-            'geometry': route['geometry'],
-            'distance': route['distance'],  # in meters
-            'duration': route['duration'],  # in seconds
-            'legs': route.get('legs', []),
-            'waypoints': data.get('waypoints', [])
-        }
-    else:
-        print(f"OSRM error: {data.get('message', 'Unknown error')}")
-        return None
+    for attempt in range(retries):
+        try:
+            res = SESSION.get(url, params=params)
+            res.raise_for_status()
+            data = orjson.loads(res.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            print(f"Error on attempt {attempt+1} for {url}: {e}")
+            time.sleep(1)
+            continue
+        
+        if data.get('code') == 'Ok' and data.get('routes'):
+            waypoints = data.get('waypoints', [])
+            return [
+                {
+                    'geometry': get_leg_geometry(leg),
+                    'distance': leg['distance'],  # in meters
+                    'duration': leg['duration'],  # in seconds
+                    'legs': [leg],
+                    'waypoints': waypoints[k:k + 2]
+                }
+                for k, leg in enumerate(data['routes'][0]['legs'])
+            ]
+        else:
+            print(f"OSRM error: {data.get('message', 'Unknown error')}")
+            return None
+    return None
     
 
 def get_all_route_segments(route: List[Dict]) -> List[Dict]:
@@ -61,22 +101,38 @@ def get_all_route_segments(route: List[Dict]) -> List[Dict]:
     Returns:
         List of route segments with detailed geometry
     """
+    # Column-wise copies of the route so segment endpoints are plain array lookups
+    n = len(route)
+    names = [station['station_name'] for station in route]
+    lats = np.array([station['lat'] for station in route])
+    lngs = np.array([station['lng'] for station in route])
+    next_idx = np.roll(np.arange(n), -1).tolist()
+    
+    lat_lng = np.column_stack((lats, lngs)).tolist()
+    lng_lat = np.column_stack((lngs, lats)).tolist()
+    
+    # The closed tour is split into chains of stops that overlap by one, each fetched as a
+    # single multi-waypoint request, so every leg of the tour comes from exactly one chain
+    tour = lng_lat + lng_lat[:1]
+    chains = [tour[k:k + MAX_WAYPOINTS] for k in range(0, n, MAX_WAYPOINTS - 1)]
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        chain_legs = list(executor.map(get_route_legs, chains))
+    
+    route_infos = []
+    for k, legs in enumerate(chain_legs):
+        if legs is None:
+            raise RuntimeError(f"Could not get directions for chain {k + 1} of {len(chains)}")
+        route_infos.extend(legs)
+    
     segments = []
-    for i in range(len(route)):
-        station = route[i]
-        next_station = route[(i + 1) % len(route)]
-        
-        start_coords = (station['lng'], station['lat'])
-        end_coords = (next_station['lng'], next_station['lat'])
-        
-        route_info = get_route_geometry(start_coords, end_coords)
-        
+    for i, (j, route_info) in enumerate(zip(next_idx, route_infos)):
         segments.append({
             'segment_id': i + 1,
-            'from_station': station['station_name'],
-            'to_station': next_station['station_name'],
-            'from_coords': [station['lat'], station['lng']],
-            'to_coords': [next_station['lat'], next_station['lng']],
+            'from_station': names[i],
+            'to_station': names[j],
+            'from_coords': lat_lng[i],
+            'to_coords': lat_lng[j],
             'distance_meters': route_info['distance'],
             'distance_km': route_info['distance'] / 1000,
             'duration_seconds': route_info['duration'],
@@ -138,103 +194,58 @@ def create_geojson_output(route_data: List[Dict], segments: List[Dict]) -> Dict:
         "features": features
     }
 
-def create_folium_map_with_routes(route_data: List[Dict], segments: List[Dict], filename: str):
+def create_map_with_routes(geojson_data: Dict, filename: str):
     """
     Create an interactive map with the actual routing paths.
     
+    The FeatureCollection is embedded into a static Leaflet page in one string
+    substitution, and all markers and lines are rendered in the browser.
+    
     Args:
-        route_data: Original station data
-        segments: Route segments with geometry
+        geojson_data: GeoJSON FeatureCollection from `create_geojson_output`
         filename: Output HTML filename
     """
     # Calculate center point
-    lats = [station['lat'] for station in route_data]
-    lngs = [station['lng'] for station in route_data]
-    center_lat = sum(lats) / len(lats)
-    center_lng = sum(lngs) / len(lngs)
-    
-    # Create map
-    m = folium.Map(
-        location=[center_lat, center_lng],
-        zoom_start=13,
-        tiles='OpenStreetMap'
-    )
-    
-    # Add station markers
-    for station in route_data:
-        popup_text = f"""
-        <b>{station['station_name']}</b><br>
-        Stop #{station['stop_number']}<br>
-        Coordinates: {station['lat']:.6f}, {station['lng']:.6f}<br>
-        Cumulative Distance: {station['cumulative_distance_km']:.2f} km
-        """
-        
-        folium.Marker(
-            location=[station['lat'], station['lng']],
-            popup=folium.Popup(popup_text, max_width=300),
-            tooltip=f"Stop {station['stop_number']}: {station['station_name']}",
-            icon=folium.Icon(color='blue', icon='bicycle', prefix='fa')
-        ).add_to(m)
+    station_coords = np.array([
+        feature['geometry']['coordinates']
+        for feature in geojson_data['features']
+        if feature['properties']['type'] == 'station'
+    ])
+    center_lng, center_lat = station_coords.mean(axis=0)
     
-    # Add route segments
-    total_segments_with_geometry = 0
-    for segment in segments:
-        if segment['geometry'] and segment['geometry']['coordinates']:
-            # Convert GeoJSON coordinates to Folium format (lat, lng)
-            coordinates = segment['geometry']['coordinates']
-            if segment['geometry']['type'] == 'LineString':
-                # Coordinates are in [lng, lat] format, need to flip to [lat, lng]
-                route_coords = [[coord[1], coord[0]] for coord in coordinates]
-                
-                popup_text = f"""
-                <b>Segment {segment['segment_id']}</b><br>
-                From: {segment['from_station']}<br>
-                To: {segment['to_station']}<br>
-                Distance: {segment['distance_km']:.2f} km<br>
-                Duration: {segment['duration_minutes']:.1f} minutes
-                """
-                
-                folium.PolyLine(
-                    locations=route_coords,
-                    color='red',
-                    weight=3,
-                    opacity=0.8,
-                    popup=folium.Popup(popup_text, max_width=300),
-                    tooltip=f"Segment {segment['segment_id']}"
-                ).add_to(m)
-                
-                total_segments_with_geometry += 1
-    
-    # Add legend
-    legend_html = f'''
-    <div style="position: fixed; 
-                bottom: 50px; left: 50px; width: 200px; height: 120px; 
-                background-color: white; border:2px solid grey; z-index:9999; 
-                font-size:14px; padding: 10px">
-        <p><b>Blue Bikes TSP Route</b></p>
-        <p><i class="fa fa-bicycle" style="color:blue"></i> Bike Station</p>
-        <p><span style="color:red; font-weight:bold;">━━━</span> Bike Route</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
+    with open(MAP_TEMPLATE, 'r', encoding='utf-8') as file:
+        template = file.read()
+    
+    # Escape "</" so no station name can close the inline <script> early
+    features_json = orjson.dumps(geojson_data, option=JSON_OPTIONS).decode().replace('</', '<\\/')
+    html = template.replace('{CENTER}', f'[{center_lat}, {center_lng}]').replace('{FEATURES_JSON}', features_json)
     
     # Save map
-    m.save(filename)
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(html)
 
-def main(route_file):
-    """Main function to process the route and get detailed directions."""
-    route = load_route(route_file)
+def main(route_file, route=None):
+    """
+    Main function to process the route and get detailed directions.
+    
+    Args:
+        route_file: Route CSV, which also names the output files
+        route: Route rows already in memory, in the format of `load_route`; read from `route_file` when omitted
+    """
+    if route is None:
+        route = load_route(route_file)
 
     route_file_stem = route_file.split('.')[0].split('/')[-1]
 
+    # Compact orjson output: the geometries make these files large, and pretty-printing them was most of the cost
     segments = get_all_route_segments(route)
-    with open(f'outputs/directions/{route_file_stem}_directions.json', 'w', encoding='utf-8') as file:
-        json.dump(segments, file, indent=2, ensure_ascii=False)
+    with open(f'outputs/directions/{route_file_stem}_directions.json', 'wb') as file:
+        file.write(orjson.dumps(segments, option=JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE))
     
     geojson_data = create_geojson_output(route, segments)
-    with open(f'outputs/directions/{route_file_stem}_directions.geojson', 'w', encoding='utf-8') as file:
-        json.dump(geojson_data, file, indent=2)
-    create_folium_map_with_routes(route, segments, f'outputs/maps/{route_file_stem}_detailed.html')
+    with open(f'outputs/directions/{route_file_stem}_directions.geojson', 'wb') as file:
+        file.write(orjson.dumps(geojson_data, option=JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE))
+    create_map_with_routes(geojson_data, f'outputs/maps/{route_file_stem}_detailed.html')
 
 if __name__ == "__main__":
     main(ROUTE_FILE)
\ No newline at end of file
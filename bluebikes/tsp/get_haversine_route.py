@@ -1,7 +1,7 @@
 import os
-from python_tsp.heuristics import solve_tsp_simulated_annealing
-from helpers import load_stations, get_haversine_distance_matrix, write_route_to_csv, format_python_tsp_route, load_route
+from helpers import load_stations, load_haversine_distance_matrix, write_route_to_csv, format_python_tsp_route, load_route
 from get_directions import main as create_map_w_directions
+from bluebikes.tsp.heuristics_numba import solve_tsp_simulated_annealing
 
 ROUTE_FILE = "outputs/routes/haversine_route.csv"
 
@@ -19,15 +19,16 @@ def main(max_stations=None):
     """
     stations = load_stations()
     selected_stations = stations[:max_stations] if max_stations else stations
-    distance_matrix = get_haversine_distance_matrix(selected_stations)
+    distance_matrix = load_haversine_distance_matrix(stations)
+    selected_matrix = distance_matrix[:max_stations, :max_stations] if max_stations else distance_matrix
 
     last_route = load_route(ROUTE_FILE) if os.path.exists(ROUTE_FILE) else None
     x0 = [waypoint["station_id"] for waypoint in last_route] if last_route and len(last_route) == len(selected_stations) else None
     
-    raw_route, _ = solve_tsp_simulated_annealing(distance_matrix, x0, alpha=0.95)
+    raw_route, _ = solve_tsp_simulated_annealing(selected_matrix, x0, alpha=0.95)
     route = format_python_tsp_route(selected_stations, raw_route)
     write_route_to_csv(route, ROUTE_FILE)
-    create_map_w_directions(ROUTE_FILE)
+    create_map_w_directions(ROUTE_FILE, route)
 
 
 if __name__ == "__main__":
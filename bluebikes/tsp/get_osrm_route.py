@@ -1,47 +1,67 @@
+import orjson
 import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from urllib3.util.retry import Retry
+from bluebikes.tsp.helpers_numba import encode_polyline
 from helpers import load_stations, write_route_to_csv
 from get_directions import main as create_map_w_directions
 
 OSRM_URL = "http://localhost:5000/trip/v1/bicycle"
 ROUTE_FILE = "outputs/routes/osrm_route.csv"
+MAX_COORDS_LENGTH = 8000  # Longer coordinate lists are sent polyline-encoded to keep the URL short
 
-def format_osrm_route(data, stations):
-    route = []
-    for idx, waypoint in enumerate(data["waypoints"]):
-        station = stations[idx]
-
-        route.append({
-            "stop_number": waypoint["waypoint_index"],
-            "station_id": station["id"],
-            "station_name": station["station_name"],
-            "lat": station["lat"],
-            "lng": station["lng"],
-            "distance_to_next_km": round(waypoint["distance"], 3)
-        })
+# Keep-alive session that retries dropped connections with a short backoff
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.1)))
 
+def format_osrm_route(data, stations):
+    waypoints = data["waypoints"]
 
-    route.sort(key=lambda x: x["stop_number"])  # Sort by waypoint index
-
-    cumulative_distance = 0.0
-    for idx, waypoint in enumerate(route):
-        route[idx]["cumulative_distance_km"] = round(cumulative_distance, 3)
-        cumulative_distance += waypoint["distance_to_next_km"]
+    # Stations in trip order, so everything below is a single pass over the stops
+    order = np.argsort([waypoint["waypoint_index"] for waypoint in waypoints])
+    distances = np.array([round(waypoint["distance"], 3) for waypoint in waypoints])[order]
+    cumulative = np.concatenate(([0.0], np.cumsum(distances)[:-1]))
 
-    return route
+    columns = zip(
+        stations.ids[order].tolist(),
+        stations.names[order].tolist(),
+        stations.lat[order].tolist(),
+        stations.lng[order].tolist(),
+        distances.tolist(),
+        cumulative.tolist()
+    )
+    return [
+        {
+            "stop_number": stop,
+            "station_id": station_id,
+            "station_name": name,
+            "lat": lat,
+            "lng": lng,
+            "distance_to_next_km": distance,
+            "cumulative_distance_km": round(cumulative_distance, 3)
+        }
+        for stop, (station_id, name, lat, lng, distance, cumulative_distance) in enumerate(columns)
+    ]
 
 def main(max_stations=None):
     stations = load_stations()
     selected_stations = stations[:max_stations] if max_stations else stations 
 
-    url = f"{OSRM_URL}/{';'.join([f'{s['lng']},{s['lat']}' for s in selected_stations])}"
+    coords = ';'.join([f'{lng},{lat}' for lng, lat in zip(selected_stations.lng.tolist(), selected_stations.lat.tolist())])
+    if len(coords) > MAX_COORDS_LENGTH:
+        # OSRM only accepts GET, so compress the stations into its polyline6 coordinate format instead
+        coords = f"polyline6({quote(encode_polyline(np.column_stack((selected_stations.lat, selected_stations.lng))), safe='')})"
+    url = f"{OSRM_URL}/{coords}"
 
-    r = requests.get(url)
+    r = SESSION.get(url, timeout=120)  # Solving the trip for every station can take a while
     r.raise_for_status()
-    raw_route = r.json()
+    raw_route = orjson.loads(r.content)
 
     route = format_osrm_route(raw_route, selected_stations)
     write_route_to_csv(route, ROUTE_FILE)
-    create_map_w_directions(ROUTE_FILE)
+    create_map_w_directions(ROUTE_FILE, route)
 
 
 if __name__ == "__main__":
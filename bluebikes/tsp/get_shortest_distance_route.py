@@ -1,9 +1,11 @@
 import os
-from python_tsp.heuristics import solve_tsp_simulated_annealing
 from helpers import load_stations, load_distance_matrix, format_python_tsp_route, write_route_to_csv, load_route
 from get_directions import main as create_map_w_directions
+from bluebikes.tsp.heuristics_numba import solve_tsp_simulated_annealing
+from bluebikes.tsp.heuristics_ortools import solve_tsp_ortools
 
 ROUTE_FILE = "outputs/routes/shortest_distance_route.csv"
+SOLVER = "annealing"  # Compiled annealer; set to "ortools" for OR-tools guided local search
 
 def get_route_order(route, stations):
     ...
@@ -28,10 +30,13 @@ def main(max_stations=None):
     last_route = load_route(ROUTE_FILE) if os.path.exists(ROUTE_FILE) else None
     x0 = [waypoint["station_id"] for waypoint in last_route] if last_route and len(last_route) == len(selected_stations) else None
     
-    raw_route, _ = solve_tsp_simulated_annealing(selected_matrix, x0, alpha=0.97)
-    route = format_python_tsp_route(selected_stations, raw_route)
+    if SOLVER == "ortools":
+        raw_route, _ = solve_tsp_ortools(selected_matrix, x0)
+    else:
+        raw_route, _ = solve_tsp_simulated_annealing(selected_matrix, x0, alpha=0.97)
+    route = format_python_tsp_route(selected_stations, raw_route, selected_matrix)
     write_route_to_csv(route, ROUTE_FILE)
-    create_map_w_directions(ROUTE_FILE)
+    create_map_w_directions(ROUTE_FILE, route)
 
 
 if __name__ == "__main__":
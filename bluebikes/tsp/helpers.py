@@ -1,27 +1,91 @@
+import os
 import csv
+import copy
+import hashlib
+from dataclasses import dataclass, field, fields
+from operator import itemgetter
 import numpy as np
 import folium
 from folium import plugins
+from bluebikes.tsp.helpers_numba import R, great_circle_matrix
 
-def load_stations():
-    stations = []
-    with open("data/stations/stations.csv", newline="") as f:
+HAVERSINE_CACHE_DIR = '.cache'
+
+# Leaflet callback for FastMarkerCluster rows of [lat, lng, popup_html, tooltip, color]
+STATION_MARKER_CALLBACK = """
+var callback = function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'bicycle', prefix: 'fa', markerColor: row[4]});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2], {maxWidth: 300});
+    marker.bindTooltip(row[3]);
+    return marker;
+};
+"""
+
+@dataclass
+class Stations:
+    """
+    Station data stored as one array per field rather than one dictionary per station.
+    
+    Attributes:
+        ids (numpy.ndarray): Station ids
+        names (numpy.ndarray): Station names
+        lat, lng (numpy.ndarray): Latitudes and longitudes in degrees
+        lat_r, lng_r (numpy.ndarray): Latitudes and longitudes in radians
+        sinlat, coslat (numpy.ndarray): Sines and cosines of latitude
+    """
+    ids: np.ndarray
+    names: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    lat_r: np.ndarray = field(init=False, repr=False)
+    lng_r: np.ndarray = field(init=False, repr=False)
+    sinlat: np.ndarray = field(init=False, repr=False)
+    coslat: np.ndarray = field(init=False, repr=False)
+    
+    def __post_init__(self):
+        # Precomputed once so haversine calls don't redo the trig per pair
+        self.lat_r = np.radians(self.lat)
+        self.lng_r = np.radians(self.lng)
+        self.sinlat = np.sin(self.lat_r)
+        self.coslat = np.cos(self.lat_r)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, key):
+        """
+        Select a subset of stations with a slice or an index array, e.g. `stations[:max_stations]`.
+        The precomputed trig columns are sliced along with the rest instead of being recomputed.
+        """
+        subset = copy.copy(self)
+        for column in fields(self):
+            setattr(subset, column.name, getattr(self, column.name)[key])
+        return subset
+
+def load_stations(file_path="data/stations/stations.csv"):
+    ids, names, lats, lngs = [], [], [], []
+    with open(file_path, newline="") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            stations.append({
-                "id": row["id"],
-                "station_name": row["station_name"],
-                "lat": float(row["lat"]),
-                "lng": float(row["lng"])
-            })
-    return stations
+            ids.append(int(row["id"]))
+            names.append(row["station_name"])
+            lats.append(float(row["lat"]))
+            lngs.append(float(row["lng"]))
+    
+    return Stations(
+        ids=np.array(ids),
+        names=np.array(names, dtype=object),
+        lat=np.array(lats),
+        lng=np.array(lngs)
+    )
 
 def write_route_to_csv(route, output_file):
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         fieldnames = ['stop_number', 'station_id', 'station_name', 'lat', 'lng', 'distance_to_next_km', 'cumulative_distance_km']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(route)
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        writer.writerows(map(itemgetter(*fieldnames), route))
 
     print(f"Route written to {output_file}. Total Distance: {route[-1]['cumulative_distance_km']} km")
 
@@ -72,88 +136,157 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     r = 6371
     return c * r
 
+def haversine_pre(stations, i, j):
+    """
+    Calculate the Haversine distance between stations returned by `load_stations`,
+    reusing their precomputed radians and cos(lat).
+    
+    Args:
+        stations (Stations): Stations returned by `load_stations`
+        i, j (int or numpy.ndarray): Indices of the stations, paired elementwise when given as arrays
+    
+    Returns:
+        float or numpy.ndarray: Distance in kilometers
+    """
+    dlat = stations.lat_r[j] - stations.lat_r[i]
+    dlng = stations.lng_r[j] - stations.lng_r[i]
+    a = np.sin(dlat/2)**2 + stations.coslat[i] * stations.coslat[j] * np.sin(dlng/2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
 def get_haversine_distance_matrix(stations):
     """
-    Create a distance matrix for all stations using Haversine distance.
+    Create a great-circle distance matrix for all stations (spherical law of cosines, which matches
+    the Haversine distance to well under a meter at city scale).
     
     Args:
-        stations (list): List of stations [name, lat, lng]
+        stations (Stations): Stations returned by `load_stations`
     
     Returns:
-        numpy.ndarray: Distance matrix where element [i][j] is distance from station i to station j
+        numpy.ndarray: float32 distance matrix where element [i][j] is distance from station i to station j
+    """
+    sinlat, coslat, lng = (np.ascontiguousarray(a) for a in (stations.sinlat, stations.coslat, stations.lng_r))
+    return great_circle_matrix(sinlat, coslat, lng)
+
+def save_npy_atomic(file_path, array):
+    """
+    Save an array as .npy through a temporary file in the same directory, then rename it into place.
+    An interrupted write never leaves a truncated file at `file_path` for later runs to load as a valid cache.
+    
+    Args:
+        file_path (str): Destination .npy path
+        array (numpy.ndarray): Array to save
+    """
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as file:
+            np.save(file, array)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_haversine_distance_matrix(stations):
     """
-    n = len(stations)
-    distance_matrix = np.zeros((n, n))
+    Load the Haversine distance matrix for a set of stations, computing and caching it on first use.
+    The cache file is keyed by a hash of the station coordinates, so any change to the set rebuilds it.
     
-    for i in range(n):
-        for j in range(n):
-            if i < j:
-                lat1, lon1 = stations[i]["lat"], stations[i]["lng"]
-                lat2, lon2 = stations[j]["lat"], stations[j]["lng"]
-                distance_matrix[i][j] = haversine_distance(lat1, lon1, lat2, lon2)
-            if i > j:
-                distance_matrix[i][j] = distance_matrix[j][i]
+    Args:
+        stations (Stations): Stations returned by `load_stations`
     
-    return distance_matrix
+    Returns:
+        numpy.ndarray: Read-only float32 memory map where element [i][j] is distance from station i to station j
+    """
+    coords = np.column_stack((stations.lat, stations.lng))
+    key = hashlib.blake2b(coords.tobytes(), digest_size=8).hexdigest()
+    cache_path = os.path.join(HAVERSINE_CACHE_DIR, f'dm_{key}.f32.npy')
+    
+    if not os.path.exists(cache_path):
+        os.makedirs(HAVERSINE_CACHE_DIR, exist_ok=True)
+        save_npy_atomic(cache_path, get_haversine_distance_matrix(stations))
+    
+    # Always served from the memory map, so every run shares the same page-cached copy
+    return np.load(cache_path, mmap_mode='r')
+
+def convert_matrix_to_npy(metric):
+    """
+    Convert the distance matrix CSV file into a float32 .npy file.
+    
+    Args:
+        metric (str): Either "distance" or "duration"
+    
+    Returns:
+        str: Path to the written .npy file
+    """
+    file_path = f'data/stations/{metric}_matrix.csv'
+    npy_path = f'data/stations/{metric}_matrix.f32.npy'
+    
+    with open(file_path, 'r', encoding='utf-8') as file:
+        n = file.readline().count(',')
+    
+    # First column holds the station ids, so it is never parsed; the division runs in place
+    distances = np.loadtxt(file_path, delimiter=',', skiprows=1, usecols=range(1, n + 1), dtype=np.float64)
+    distances /= 1000.0
+    if np.isnan(distances).any():
+        raise ValueError(f"{file_path} has unreachable station pairs; rebuild it with make_distance_matrix.py")
+    save_npy_atomic(npy_path, distances.astype(np.float32))
+    
+    return npy_path
 
 def load_distance_matrix(metric):
     """
-    Load the distance matrix from CSV file.
+    Load the distance matrix, converting it from CSV on first use or after the CSV changes.
     
     Args:
-        file_path (str): Path to the distance matrix CSV file
+        metric (str): Either "distance" or "duration"
     
     Returns:
-        numpy.ndarray: Distance matrix where element [i][j] is distance from station i to station j
+        numpy.ndarray: Read-only float32 memory map where element [i][j] is distance from station i to station j
     """
-    file_path = 'data/stations/distance_matrix.csv' if metric == "distance" else 'data/stations/duration_matrix.csv'
-    distances = []
-    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader)
-        
-        for row in reader:
-            distance_row = [float(val) for val in row[1:]]
-            distances.append(distance_row)
+    file_path = f'data/stations/{metric}_matrix.csv'
+    npy_path = f'data/stations/{metric}_matrix.f32.npy'
     
-    return np.array(distances) / 1000.0
+    # Reconvert whenever the CSV has been regenerated since the .npy was written
+    if not os.path.exists(npy_path) or (os.path.exists(file_path) and os.path.getmtime(file_path) > os.path.getmtime(npy_path)):
+        convert_matrix_to_npy(metric)
+    
+    return np.load(npy_path, mmap_mode='r')
 
-def format_python_tsp_route(stations, route):
+def format_python_tsp_route(stations, route, distance_matrix=None):
     """
     Export the TSP route to a CSV file with detailed information.
     
     Args:
-        stations (list): List of stations [name, lat, lng]
+        stations (Stations): Stations returned by `load_stations`
         route (list): List of station indices representing the route
-        total_distance (float): Total distance of the route in kilometers
-        filename (str): Output CSV filename
+        distance_matrix (numpy.ndarray): Optional matrix the route was solved on, in kilometers;
+            hop distances are read from it instead of using the Haversine distance
     """
-    csv_data = []
-    cumulative_distance = 0.0
+    route = np.asarray(route, dtype=np.intp)
     
-    for i, station_idx in enumerate(route):
-        station = stations[station_idx]
-        
-        # Calculate distance to next station
-        if i < len(route) - 1:
-            next_station = stations[route[i + 1]]
-            distance_to_next = haversine_distance(station["lat"], station["lng"], next_station["lat"], next_station["lng"])
-        else:
-            distance_to_next = 0
-        
-        # Add to CSV data
+    # Distance from each stop to the next one, with none after the last stop
+    distances = np.zeros(len(route))
+    if distance_matrix is not None:
+        distances[:-1] = distance_matrix[route[:-1], route[1:]]
+    else:
+        distances[:-1] = haversine_pre(stations, route[:-1], route[1:])
+    cumulative = np.concatenate(([0.0], np.cumsum(distances)[:-1]))
+    
+    ids = stations.ids[route].tolist()
+    names = stations.names[route].tolist()
+    lats = stations.lat[route].tolist()
+    lngs = stations.lng[route].tolist()
+    
+    csv_data = []
+    for i, (distance_to_next, cumulative_distance) in enumerate(zip(distances.tolist(), cumulative.tolist())):
         csv_data.append({
             "stop_number": i + 1,
-            "station_id": station["id"],
-            "station_name": station["station_name"],
-            "lat": station["lat"],
-            "lng": station["lng"],
+            "station_id": ids[i],
+            "station_name": names[i],
+            "lat": lats[i],
+            "lng": lngs[i],
             "distance_to_next_km": round(distance_to_next, 3),
             "cumulative_distance_km": round(cumulative_distance, 3)
         })
-        
-        # Update cumulative distance for next iteration
-        cumulative_distance += distance_to_next
     
     return csv_data
 
@@ -163,7 +296,7 @@ def create_interactive_map(stations, route, filename):
     Create an interactive map using folium showing stations and the TSP route.
     
     Args:
-        stations (list): List of stations [name, lat, lng]
+        stations (Stations): Stations returned by `load_stations`
         route (list): Optional route as list of station indices
         filename (str): Output HTML filename
     
@@ -171,8 +304,8 @@ def create_interactive_map(stations, route, filename):
         folium.Map: The created map object
     """
     # Calculate map center
-    center_lat = np.mean([s["lat"] for s in stations])
-    center_lng = np.mean([s["lng"] for s in stations])
+    center_lat = stations.lat.mean()
+    center_lng = stations.lng.mean()
     
     # Create map
     m = folium.Map(
@@ -181,39 +314,33 @@ def create_interactive_map(stations, route, filename):
         tiles='OpenStreetMap'
     )
     
-    # Add stations as markers
-    for i, station in enumerate(stations):
-        station_name, lat, lng = station["station_name"], station["lat"], station["lng"]
-        
+    # Position of each station in the route, looked up once per marker below
+    pos_map = {station_idx: k + 1 for k, station_idx in enumerate(route)} if route else {}
+    
+    # Add stations as markers, serialized as a single data array rendered client-side
+    markers = []
+    for i, (station_name, lat, lng) in enumerate(zip(stations.names.tolist(), stations.lat.tolist(), stations.lng.tolist())):
         # Different colors for route stations
         color = 'blue'
-        if route and i in route:
-            route_position = route.index(i) + 1
+        route_position = pos_map.get(i)
+        if route_position is not None:
             color = 'red'
             popup_text = f"<b>{station_name}</b><br>Stop #{route_position}<br>Lat: {lat:.6f}<br>Lng: {lng:.6f}"
         else:
             popup_text = f"<b>{station_name}</b><br>Lat: {lat:.6f}<br>Lng: {lng:.6f}"
         
-        folium.Marker(
-            location=[lat, lng],
-            popup=folium.Popup(popup_text, max_width=300),
-            tooltip=station_name,
-            icon=folium.Icon(color=color, icon='bicycle', prefix='fa')
-        ).add_to(m)
+        markers.append([lat, lng, popup_text, station_name, color])
+    
+    plugins.FastMarkerCluster(markers, callback=STATION_MARKER_CALLBACK).add_to(m)
     
     # Add route line if provided
     if route:
-        route_coords = []
-        for waypoint in route:
-            lat, lng = waypoint["lat"], waypoint["lng"]
-            route_coords.append([lat, lng])
-        
-        # Close the loop by returning to start
-        if route_coords:
-            route_coords.append(route_coords[0])
+        # Route order followed by the first stop again to close the loop
+        stops = np.append(route, route[0])
+        route_coords = np.column_stack((stations.lat[stops], stations.lng[stops])).tolist()
         
         # Add the route line
-        folium.PolyLine(
+        route_line = folium.PolyLine(
             locations=route_coords,
             color='red',
             weight=3,
@@ -221,9 +348,9 @@ def create_interactive_map(stations, route, filename):
             popup='TSP Route'
         ).add_to(m)
         
-        # Add arrows to show direction
+        # Add arrows to show direction along the same line
         plugins.PolyLineTextPath(
-            folium.PolyLine(route_coords, weight=0),
+            route_line,
             "→",
             repeat=True,
             offset=10,
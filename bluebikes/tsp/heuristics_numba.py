@@ -0,0 +1,240 @@
+import math
+import numpy as np
+from numba import njit, prange, get_num_threads
+
+# Kernels are compiled for float32 kilometers or int32 meters, both half the width of float64
+@njit(['f8(f4[:, ::1], i4[::1])', 'f8(i4[:, ::1], i4[::1])'], cache=True, fastmath=True)
+def tour_length(D, tour):
+    """
+    Length of the closed tour, including the edge back to the start.
+    """
+    n = tour.shape[0]
+    total = 0.0
+    for k in range(n):
+        total += D[tour[k], tour[(k + 1) % n]]
+    return total
+
+@njit(['i4[::1](f4[:, ::1], i4[::1])', 'i4[::1](i4[:, ::1], i4[::1])'], cache=True, fastmath=True)
+def two_opt(D, tour):
+    """
+    Improve a closed tour with 2-opt moves until no move shortens it.
+
+    Reversing tour[i..j] replaces edges (a, b) and (c, d) with (a, c) and (b, d).
+    The forward and reverse lengths of the inner path are accumulated as j grows,
+    so every move is priced in O(1) even when D is asymmetric.
+
+    Args:
+        D: Contiguous float32 or int32 distance matrix
+        tour: int32 array with the starting permutation
+
+    Returns:
+        numpy.ndarray: The improved permutation
+    """
+    n = tour.shape[0]
+    tour = tour.copy()
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a = tour[i - 1]
+            b = tour[i]
+            forward = 0.0
+            reverse = 0.0
+            for j in range(i + 1, n):
+                c = tour[j]
+                forward += D[tour[j - 1], c]
+                reverse += D[c, tour[j - 1]]
+                d = tour[(j + 1) % n]
+                delta = D[a, c] + D[b, d] - D[a, b] - D[c, d] + reverse - forward
+                if delta < -1e-6:
+                    lo, hi = i, j
+                    while lo < hi:
+                        tour[lo], tour[hi] = tour[hi], tour[lo]
+                        lo += 1
+                        hi -= 1
+                    improved = True
+                    break
+    return tour
+
+def to_kernel_matrix(distance_matrix):
+    """
+    Copy a distance matrix into the layout the kernels are compiled for.
+
+    The copy is always made, even when the dtype and order already match: the eager
+    signatures only accept writable arrays, and `load_distance_matrix` returns a
+    read-only memory map.
+
+    Args:
+        distance_matrix (numpy.ndarray): Distance matrix in kilometers or integer meters
+
+    Returns:
+        numpy.ndarray: Writable C-order float32 copy, or int32 for integer matrices
+    """
+    dtype = np.int32 if np.issubdtype(distance_matrix.dtype, np.integer) else np.float32
+    return np.array(distance_matrix, dtype=dtype, order='C')
+
+def solve_tsp_two_opt(distance_matrix, x0=None):
+    """
+    Drop-in replacement for `python_tsp.heuristics.solve_tsp_local_search`.
+
+    Args:
+        distance_matrix (numpy.ndarray): Distance matrix where element [i][j] is distance from station i to station j,
+            either in kilometers (run as float32) or integer meters (run as int32)
+        x0 (list): Optional starting permutation, defaults to a nearest-neighbor tour from station 0
+
+    Returns:
+        tuple: (permutation, distance)
+    """
+    D = to_kernel_matrix(distance_matrix)
+    tour = np.asarray(x0, dtype=np.int32) if x0 is not None else nearest_neighbor(D, 0)
+
+    tour = two_opt(D, tour)
+    return tour.tolist(), float(tour_length(D, tour))
+
+@njit(['i4[::1](f4[:, ::1], i8)', 'i4[::1](i4[:, ::1], i8)'], cache=True)
+def nearest_neighbor(D, start):
+    """
+    Greedy tour that always moves to the closest station not visited yet.
+
+    Args:
+        D: Contiguous float32 or int32 distance matrix
+        start: Index of the first station
+
+    Returns:
+        numpy.ndarray: int32 permutation starting at `start`
+    """
+    n = D.shape[0]
+    tour = np.empty(n, dtype=np.int32)
+    visited = np.zeros(n, dtype=np.bool_)
+    tour[0] = start
+    visited[start] = True
+    for k in range(1, n):
+        current = tour[k - 1]
+        nearest = -1
+        for j in range(n):
+            if not visited[j] and (nearest < 0 or D[current, j] < D[current, nearest]):
+                nearest = j
+        tour[k] = nearest
+        visited[nearest] = True
+    return tour
+
+@njit(cache=True, fastmath=True)
+def reversal_delta(D, tour, i, j, symmetric):
+    """
+    Change in tour length from reversing tour[i..j], with 1 <= i < j < len(tour).
+    On an asymmetric matrix the inner path is traversed backwards, so its cost is repriced too.
+    """
+    n = tour.shape[0]
+    a = tour[i - 1]
+    b = tour[i]
+    c = tour[j]
+    d = tour[(j + 1) % n]
+    delta = 0.0 + D[a, c] + D[b, d] - D[a, b] - D[c, d]
+    if not symmetric:
+        for k in range(i, j):
+            delta += D[tour[k + 1], tour[k]] - D[tour[k], tour[k + 1]]
+    return delta
+
+@njit(['i4[::1](f4[:, ::1], i4[::1], f8, b1, i8)', 'i4[::1](i4[:, ::1], i4[::1], f8, b1, i8)'], cache=True, fastmath=True)
+def simulated_annealing(D, tour, alpha, symmetric, seed):
+    """
+    Simulated annealing over 2-opt moves with a geometric cooling schedule.
+
+    The starting temperature is the mean size of a random move, and every temperature
+    step tries 50 * n moves before cooling by `alpha`, until it is 10^4 times colder.
+
+    Args:
+        D: Contiguous float32 or int32 distance matrix
+        tour: int32 array with the starting permutation
+        alpha: Cooling factor applied after every temperature step
+        symmetric: Whether D[i, j] == D[j, i], which makes every move O(1)
+        seed: Seed for the random move generator
+
+    Returns:
+        numpy.ndarray: The best permutation found
+    """
+    np.random.seed(seed)
+    n = tour.shape[0]
+    moves = 50 * n
+    tour = tour.copy()
+    best = tour.copy()
+    length = tour_length(D, tour)
+    best_length = length
+
+    temperature = 0.0
+    for _ in range(100):
+        i = np.random.randint(1, n - 1)
+        j = np.random.randint(i + 1, n)
+        temperature += abs(reversal_delta(D, tour, i, j, symmetric))
+    temperature /= 100
+    final_temperature = temperature * 1e-4
+
+    while temperature > final_temperature:
+        for _ in range(moves):
+            i = np.random.randint(1, n - 1)
+            j = np.random.randint(i + 1, n)
+            delta = reversal_delta(D, tour, i, j, symmetric)
+            if delta < 0 or np.random.random() < math.exp(-delta / temperature):
+                lo, hi = i, j
+                while lo < hi:
+                    tour[lo], tour[hi] = tour[hi], tour[lo]
+                    lo += 1
+                    hi -= 1
+                length += delta
+        if length < best_length:
+            best[:] = tour
+            best_length = length
+        temperature *= alpha
+    return best
+
+@njit(['i4[::1](f4[:, ::1], i4[::1], f8, b1, i8, i8)', 'i4[::1](i4[:, ::1], i4[::1], f8, b1, i8, i8)'], parallel=True, cache=True)
+def multi_start_annealing(D, tour, alpha, symmetric, seed, chains):
+    """
+    Run independent annealing chains from the same start in parallel and keep the shortest result.
+    Chain k is seeded with `seed + k`, so results do not depend on the thread count.
+
+    Args:
+        D: Contiguous float32 or int32 distance matrix
+        tour: int32 array with the starting permutation
+        alpha: Cooling factor applied after every temperature step
+        symmetric: Whether D[i, j] == D[j, i]
+        seed: Seed of the first chain
+        chains: Number of chains
+
+    Returns:
+        numpy.ndarray: The best permutation over all chains
+    """
+    tours = np.empty((chains, tour.shape[0]), dtype=np.int32)
+    lengths = np.empty(chains)
+    for k in prange(chains):
+        tours[k] = simulated_annealing(D, tour, alpha, symmetric, seed + k)
+        lengths[k] = tour_length(D, tours[k])
+    return tours[np.argmin(lengths)].copy()
+
+def solve_tsp_simulated_annealing(distance_matrix, x0=None, alpha=0.95, seed=0, chains=None):
+    """
+    Drop-in replacement for `python_tsp.heuristics.solve_tsp_simulated_annealing`.
+
+    Starts from `x0`, or from a nearest-neighbor tour, anneals it in several parallel chains
+    and finishes the best one with 2-opt so the returned tour is at a local optimum.
+
+    Args:
+        distance_matrix (numpy.ndarray): Distance matrix where element [i][j] is distance from station i to station j,
+            either in kilometers (run as float32) or integer meters (run as int32)
+        x0 (list): Optional starting permutation, defaults to a nearest-neighbor tour from station 0
+        alpha (float): Cooling factor, closer to 1 anneals longer
+        seed (int): Seed for the random move generator of the first chain
+        chains (int): Independent chains run in parallel, defaults to one per thread
+
+    Returns:
+        tuple: (permutation, distance)
+    """
+    D = to_kernel_matrix(distance_matrix)
+    tour = np.asarray(x0, dtype=np.int32) if x0 is not None else nearest_neighbor(D, 0)
+
+    # Three or fewer stations leave at most two tours, one per direction, and 2-opt alone picks the shorter
+    if len(tour) > 3:
+        chains = chains or get_num_threads()
+        tour = multi_start_annealing(D, tour, alpha, np.array_equal(D, D.T), seed, chains)
+    tour = two_opt(D, tour)
+    return tour.tolist(), float(tour_length(D, tour))